@@ -2,204 +2,245 @@
 import autogen
 from typing import Dict, List, Optional
 
+# System prompt templates; {outline_context}, {num_chapters} and {initial_prompt} are filled in by create_agents
+_SYSTEM_PROMPT_TEMPLATES = {
+    "memory_keeper": """You are the keeper of the story's continuity and context.
+Your responsibilities:
+1. Track and summarize each chapter's key events
+2. Monitor character development and relationships
+3. Maintain world-building consistency
+4. Flag any continuity issues
+
+Format your responses as follows:
+- Start updates with 'MEMORY UPDATE:'
+- List key events with 'EVENT:'
+- List character developments with 'CHARACTER:'
+- List world details with 'WORLD:'
+- Flag issues with 'CONTINUITY ALERT:'
+
+Book Overview:
+{outline_context}""",
+
+    "story_planner": """You are an expert story arc planner focused on overall narrative structure.
+
+Your sole responsibility is creating the high-level story arc.
+When given an initial story premise:
+1. Identify major plot points and story beats
+2. Map character arcs and development
+3. Note major story transitions
+4. Plan narrative pacing
+
+Format your output EXACTLY as:
+STORY_ARC:
+- Major Plot Points:
+[List each major event that drives the story]
+
+- Character Arcs:
+[For each main character, describe their development path]
+
+- Story Beats:
+[List key emotional and narrative moments in sequence]
+
+- Key Transitions:
+[Describe major shifts in story direction or tone]
+
+Always provide specific, detailed content - never use placeholders.""",
+
+    "outline_creator": """Generate a detailed chapter outline for the requested number of chapters.
+
+YOU MUST USE EXACTLY THIS FORMAT FOR EACH CHAPTER - NO DEVIATIONS:
+
+Chapter 1: [Title]
+Chapter Title: [Same title as above]
+Key Events:
+- [Event 1]
+- [Event 2]
+- [Event 3]
+Character Developments: [Specific character moments and changes]
+Setting: [Specific location and atmosphere]
+Tone: [Specific emotional and narrative tone]
+
+[REPEAT THIS EXACT FORMAT FOR EVERY CHAPTER]
+
+Requirements:
+1. EVERY field must be present for EVERY chapter
+2. EVERY chapter must have AT LEAST 3 specific Key Events
+3. ALL chapters must be detailed - no placeholders
+4. Format must match EXACTLY - including all headings and bullet points
+
+START WITH 'OUTLINE:' AND END WITH 'END OF OUTLINE'
+
+Number of Chapters: {num_chapters}
+
+Initial Premise:
+{initial_prompt}""",
+
+    "world_builder": """You are an expert in world-building who creates rich, consistent settings.
+
+Your role is to establish ALL settings and locations needed for the entire story based on a provided story arc.
+
+Your responsibilities:
+1. Review the story arc to identify every location and setting needed
+2. Create detailed descriptions for each setting, including:
+- Physical layout and appearance
+- Atmosphere and environmental details
+- Important objects or features
+- Sensory details (sights, sounds, smells)
+3. Identify recurring locations that appear multiple times
+4. Note how settings might change over time
+5. Create a cohesive world that supports the story's themes
+
+Format your response as:
+WORLD_ELEMENTS:
+
+[LOCATION NAME]:
+- Physical Description: [detailed description]
+- Atmosphere: [mood, time of day, lighting, etc.]
+- Key Features: [important objects, layout elements]
+- Sensory Details: [what characters would experience]
+
+[RECURRING ELEMENTS]:
+- List any settings that appear multiple times
+- Note any changes to settings over time
+
+[TRANSITIONS]:
+- How settings connect to each other
+- How characters move between locations
+
+Book Overview:
+{outline_context}""",
+
+    "writer": """You are an expert creative writer who brings scenes to life.
+
+Your focus:
+1. Write according to the outlined plot points
+2. Maintain consistent character voices
+3. Incorporate world-building details
+4. Create engaging prose
+5. Please make sure that you write the complete scene, do not leave it incomplete
+6. Each chapter MUST be at least 5000 words (approximately 30,000 characters). Consider this a hard requirement. If your output is shorter, continue writing until you reach this minimum length
+7. Ensure transitions are smooth and logical
+8. Do not cut off the scene, make sure it has a proper ending
+9. Add a lot of details, and describe the environment and characters where it makes sense
+
+Always reference the outline and previous content.
+Mark drafts with 'SCENE:' and final versions with 'SCENE FINAL:'
+
+Book Context:
+{outline_context}""",
+
+    "editor": """You are an expert editor ensuring quality and consistency.
+
+Your focus:
+1. Check alignment with outline
+2. Verify character consistency
+3. Maintain world-building rules
+4. Improve prose quality
+5. Return complete edited chapter
+6. Never ask to start the next chapter, as the next step is finalizing this chapter
+7. Each chapter MUST be at least 5000 words. If the content is shorter, return it to the writer for expansion. This is a hard requirement - do not approve chapters shorter than 5000 words
+
+Format your responses:
+1. Start critiques with 'FEEDBACK:'
+2. Provide suggestions with 'SUGGEST:'
+3. Return full edited chapter with 'EDITED_SCENE:'
+
+Reference specific outline elements in your feedback.
+
+Book Overview:
+{outline_context}""",
+}
+
+def format_outline_context(outline: List[Dict]) -> str:
+    """Format a book outline into the context block shared with the agents"""
+    return "Complete Book Outline:\n" + "\n".join(
+        f"\nChapter {chapter['chapter_number']}: {chapter['title']}\n{chapter['prompt']}"
+        for chapter in outline
+    )
+
 class BookAgents:
-    def __init__(self, agent_config: Dict, outline: Optional[List[Dict]] = None):
+    # Output token caps per agent; agents whose output grows with the book
+    # (story planner, outline creator, writer, editor) are left uncapped
+    DEFAULT_MAX_TOKENS = {
+        "memory_keeper": 1500,
+        "world_builder": 4000,
+    }
+
+    def __init__(self, agent_config: Dict, outline: Optional[List[Dict]] = None,
+                 max_tokens: Optional[Dict[str, int]] = None):
         """Initialize agents with book outline context"""
         self.agent_config = agent_config
         self.outline = outline
+        self.max_tokens = {**self.DEFAULT_MAX_TOKENS, **(max_tokens or {})}
         self.world_elements = {}  # Track described locations/elements
         self.character_developments = {}  # Track character arcs
-        
+
+    def _llm_config(self, agent_name: str) -> Dict:
+        """Get the LLM config for an agent, applying its output token cap"""
+        max_tokens = self.max_tokens.get(agent_name)
+        if max_tokens is None:
+            return self.agent_config
+        return {**self.agent_config, "max_tokens": max_tokens}
+
     def _format_outline_context(self) -> str:
         """Format the book outline into a readable context"""
         if not self.outline:
             return ""
-            
-        context_parts = ["Complete Book Outline:"]
-        for chapter in self.outline:
-            context_parts.extend([
-                f"\nChapter {chapter['chapter_number']}: {chapter['title']}",
-                chapter['prompt']
-            ])
-        return "\n".join(context_parts)
+
+        return format_outline_context(self.outline)
 
     def create_agents(self, initial_prompt, num_chapters) -> Dict:
         """Create and return all agents needed for book generation"""
-        outline_context = self._format_outline_context()
+        prompt_values = {
+            "outline_context": self._format_outline_context(),
+            "num_chapters": num_chapters,
+            "initial_prompt": initial_prompt,
+        }
+        system_prompts = {
+            name: template.format_map(prompt_values)
+            for name, template in _SYSTEM_PROMPT_TEMPLATES.items()
+        }
         
         # Memory Keeper: Maintains story continuity and context
         memory_keeper = autogen.AssistantAgent(
             name="memory_keeper",
-            system_message=f"""You are the keeper of the story's continuity and context.
-            Your responsibilities:
-            1. Track and summarize each chapter's key events
-            2. Monitor character development and relationships
-            3. Maintain world-building consistency
-            4. Flag any continuity issues
-            
-            Book Overview:
-            {outline_context}
-            
-            Format your responses as follows:
-            - Start updates with 'MEMORY UPDATE:'
-            - List key events with 'EVENT:'
-            - List character developments with 'CHARACTER:'
-            - List world details with 'WORLD:'
-            - Flag issues with 'CONTINUITY ALERT:'""",
-            llm_config=self.agent_config,
+            system_message=system_prompts["memory_keeper"],
+            llm_config=self._llm_config("memory_keeper"),
         )
         
         # Story Planner - Focuses on high-level story structure
         story_planner = autogen.AssistantAgent(
             name="story_planner",
-            system_message=f"""You are an expert story arc planner focused on overall narrative structure.
-
-            Your sole responsibility is creating the high-level story arc.
-            When given an initial story premise:
-            1. Identify major plot points and story beats
-            2. Map character arcs and development
-            3. Note major story transitions
-            4. Plan narrative pacing
-
-            Format your output EXACTLY as:
-            STORY_ARC:
-            - Major Plot Points:
-            [List each major event that drives the story]
-            
-            - Character Arcs:
-            [For each main character, describe their development path]
-            
-            - Story Beats:
-            [List key emotional and narrative moments in sequence]
-            
-            - Key Transitions:
-            [Describe major shifts in story direction or tone]
-            
-            Always provide specific, detailed content - never use placeholders.""",
-            llm_config=self.agent_config,
+            system_message=system_prompts["story_planner"],
+            llm_config=self._llm_config("story_planner"),
         )
 
         # Outline Creator - Creates detailed chapter outlines
         outline_creator = autogen.AssistantAgent(
             name="outline_creator",
-            system_message=f"""Generate a detailed {num_chapters}-chapter outline.
-
-            YOU MUST USE EXACTLY THIS FORMAT FOR EACH CHAPTER - NO DEVIATIONS:
-
-            Chapter 1: [Title]
-            Chapter Title: [Same title as above]
-            Key Events:
-            - [Event 1]
-            - [Event 2]
-            - [Event 3]
-            Character Developments: [Specific character moments and changes]
-            Setting: [Specific location and atmosphere]
-            Tone: [Specific emotional and narrative tone]
-
-            [REPEAT THIS EXACT FORMAT FOR ALL {num_chapters} CHAPTERS]
-
-            Requirements:
-            1. EVERY field must be present for EVERY chapter
-            2. EVERY chapter must have AT LEAST 3 specific Key Events
-            3. ALL chapters must be detailed - no placeholders
-            4. Format must match EXACTLY - including all headings and bullet points
-
-            Initial Premise:
-            {initial_prompt}
-
-            START WITH 'OUTLINE:' AND END WITH 'END OF OUTLINE'
-            """,
-            llm_config=self.agent_config,
+            system_message=system_prompts["outline_creator"],
+            llm_config=self._llm_config("outline_creator"),
         )
 
         # World Builder: Creates and maintains the story setting
         world_builder = autogen.AssistantAgent(
             name="world_builder",
-            system_message=f"""You are an expert in world-building who creates rich, consistent settings.
-            
-            Your role is to establish ALL settings and locations needed for the entire story based on a provided story arc.
-
-            Book Overview:
-            {outline_context}
-            
-            Your responsibilities:
-            1. Review the story arc to identify every location and setting needed
-            2. Create detailed descriptions for each setting, including:
-            - Physical layout and appearance
-            - Atmosphere and environmental details
-            - Important objects or features
-            - Sensory details (sights, sounds, smells)
-            3. Identify recurring locations that appear multiple times
-            4. Note how settings might change over time
-            5. Create a cohesive world that supports the story's themes
-            
-            Format your response as:
-            WORLD_ELEMENTS:
-            
-            [LOCATION NAME]:
-            - Physical Description: [detailed description]
-            - Atmosphere: [mood, time of day, lighting, etc.]
-            - Key Features: [important objects, layout elements]
-            - Sensory Details: [what characters would experience]
-            
-            [RECURRING ELEMENTS]:
-            - List any settings that appear multiple times
-            - Note any changes to settings over time
-            
-            [TRANSITIONS]:
-            - How settings connect to each other
-            - How characters move between locations""",
-            llm_config=self.agent_config,
+            system_message=system_prompts["world_builder"],
+            llm_config=self._llm_config("world_builder"),
         )
 
         # Writer: Generates the actual prose
         writer = autogen.AssistantAgent(
             name="writer",
-            system_message=f"""You are an expert creative writer who brings scenes to life.
-            
-            Book Context:
-            {outline_context}
-            
-            Your focus:
-            1. Write according to the outlined plot points
-            2. Maintain consistent character voices
-            3. Incorporate world-building details
-            4. Create engaging prose
-            5. Please make sure that you write the complete scene, do not leave it incomplete
-            6. Each chapter MUST be at least 5000 words (approximately 30,000 characters). Consider this a hard requirement. If your output is shorter, continue writing until you reach this minimum length
-            7. Ensure transitions are smooth and logical
-            8. Do not cut off the scene, make sure it has a proper ending
-            9. Add a lot of details, and describe the environment and characters where it makes sense
-            
-            Always reference the outline and previous content.
-            Mark drafts with 'SCENE:' and final versions with 'SCENE FINAL:'""",
-            llm_config=self.agent_config,
+            system_message=system_prompts["writer"],
+            llm_config=self._llm_config("writer"),
         )
 
         # Editor: Reviews and improves content
         editor = autogen.AssistantAgent(
             name="editor",
-            system_message=f"""You are an expert editor ensuring quality and consistency.
-            
-            Book Overview:
-            {outline_context}
-            
-            Your focus:
-            1. Check alignment with outline
-            2. Verify character consistency
-            3. Maintain world-building rules
-            4. Improve prose quality
-            5. Return complete edited chapter
-            6. Never ask to start the next chapter, as the next step is finalizing this chapter
-            7. Each chapter MUST be at least 5000 words. If the content is shorter, return it to the writer for expansion. This is a hard requirement - do not approve chapters shorter than 5000 words
-            
-            Format your responses:
-            1. Start critiques with 'FEEDBACK:'
-            2. Provide suggestions with 'SUGGEST:'
-            3. Return full edited chapter with 'EDITED_SCENE:'
-            
-            Reference specific outline elements in your feedback.""",
-            llm_config=self.agent_config,
+            system_message=system_prompts["editor"],
+            llm_config=self._llm_config("editor"),
         )
 
         # User Proxy: Manages the interaction
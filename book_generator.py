@@ -4,6 +4,68 @@ from typing import Dict, List, Optional
 import os
 import time
 import re
+import shutil
+from agents import format_outline_context
+
+# Chapter-number artifacts stripped from generated chapter text
+_CHAPTER_REF_RE = re.compile(r'\*?\s*\(Chapter \d+.*?\)')
+_CHAPTER_HEADING_RE = re.compile(r'\*?\s*Chapter \d+.*?\n')
+
+# First "Chapter N:" reference in a conversation identifies the chapter being written
+_CHAPTER_NUMBER_RE = re.compile(r"Chapter (\d+):")
+
+# Per-chapter task sent to the group chat
+_CHAPTER_PROMPT_TEMPLATE = """
+IMPORTANT: Wait for confirmation before proceeding.
+IMPORTANT: This is Chapter {chapter_number}. Do not proceed to next chapter until explicitly instructed.
+DO NOT END THE STORY HERE unless this is actually the final chapter ({final_chapter}).
+
+Current Task: Generate Chapter {chapter_number} content only.
+
+Chapter Outline:
+Title: {title}
+
+Chapter Requirements:
+{prompt}
+
+Previous Context for Reference:
+{context}
+
+Follow this exact sequence for Chapter {chapter_number} only:
+
+1. Memory Keeper: Context (MEMORY UPDATE)
+2. Writer: Draft (CHAPTER)
+3. Editor: Review (FEEDBACK)
+4. Writer Final: Revision (CHAPTER FINAL)
+
+Wait for each step to complete before proceeding."""
+
+# Simplified task used when the full chapter sequence fails
+_RETRY_PROMPT_TEMPLATE = """Emergency chapter generation for Chapter {chapter_number}.
+
+{prompt}
+
+Please generate this chapter in two steps:
+1. Story Planner: Create a basic outline (tag: PLAN)
+2. Writer: Write the complete chapter (tag: SCENE FINAL)
+
+Keep it simple and direct."""
+
+# Completion steps detected by a plain marker in any message, in speaking order
+_SEQUENCE_MARKERS = (
+    ('memory_update', "MEMORY UPDATE:"),
+    ('plan', "PLAN:"),
+    ('setting', "SETTING:"),
+    ('scene', "SCENE:"),
+    ('feedback', "FEEDBACK:"),
+)
+
+def _marker_section(content: str, marker: str) -> str:
+    """Text between the first occurrence of marker and the next one (or the end)"""
+    # Same result as content.split(marker)[1] without splitting the whole message
+    start = content.find(marker) + len(marker)
+    end = content.find(marker, start)
+    return content[start:end] if end != -1 else content[start:]
 
 class BookGenerator:
     def __init__(self, agents: Dict[str, autogen.ConversableAgent], agent_config: Dict, outline: List[Dict]):
@@ -13,14 +75,26 @@ class BookGenerator:
         self.output_dir = "book_output"
         self.chapters_memory = []  # Store chapter summaries
         self.max_iterations = 3  # Limit editor-writer iterations
+        self.memory_window = 6  # Number of most recent chapter summaries passed as context
         self.outline = outline  # Store the outline
+        self._chapters_by_number = {ch['chapter_number']: ch for ch in outline}
+        # Shared system prefix for every chapter's group chat, built once per book
+        self._outline_context = format_outline_context(
+            sorted(outline, key=lambda x: x['chapter_number'])
+        )
+        # Final-revision writer reused by every chapter's group chat
+        self._writer_final = autogen.AssistantAgent(
+            name="writer_final",
+            system_message=agents["writer"].system_message,
+            llm_config=agent_config
+        )
         os.makedirs(self.output_dir, exist_ok=True)
 
     def _clean_chapter_content(self, content: str) -> str:
         """Clean up chapter content by removing artifacts and chapter numbers"""
         # Remove chapter number references
-        content = re.sub(r'\*?\s*\(Chapter \d+.*?\)', '', content)
-        content = re.sub(r'\*?\s*Chapter \d+.*?\n', '', content, count=1)
+        content = _CHAPTER_REF_RE.sub('', content)
+        content = _CHAPTER_HEADING_RE.sub('', content, count=1)
         
         # Clean up any remaining markdown artifacts
         content = content.replace('*', '')
@@ -31,29 +105,18 @@ class BookGenerator:
 
     def initiate_group_chat(self) -> autogen.GroupChat:
         """Create a new group chat for the agents with improved speaking order"""
-        outline_context = "\n".join([
-            f"\nChapter {ch['chapter_number']}: {ch['title']}\n{ch['prompt']}"
-            for ch in sorted(self.outline, key=lambda x: x['chapter_number'])
-        ])
-
         messages = [{
             "role": "system",
-            "content": f"Complete Book Outline:\n{outline_context}"
+            "content": self._outline_context
         }]
 
-        writer_final = autogen.AssistantAgent(
-            name="writer_final",
-            system_message=self.agents["writer"].system_message,
-            llm_config=self.agent_config
-        )
-        
         return autogen.GroupChat(
             agents=[
                 self.agents["user_proxy"],
                 self.agents["memory_keeper"],
                 self.agents["writer"],
                 self.agents["editor"],
-                writer_final
+                self._writer_final
             ],
             messages=messages,
             max_round=5,
@@ -69,15 +132,9 @@ class BookGenerator:
         print("******************** VERIFYING CHAPTER COMPLETION ****************")
         current_chapter = None
         chapter_content = None
-        sequence_complete = {
-            'memory_update': False,
-            'plan': False,
-            'setting': False,
-            'scene': False,
-            'feedback': False,
-            'scene_final': False,
-            'confirmation': False
-        }
+        sequence_complete = {step: False for step, _ in _SEQUENCE_MARKERS}
+        sequence_complete['scene_final'] = False
+        sequence_complete['confirmation'] = False
         
         # Analyze full conversation
         for msg in messages:
@@ -85,30 +142,28 @@ class BookGenerator:
             
             # Track chapter number
             if not current_chapter:
-                num_match = re.search(r"Chapter (\d+):", content)
+                num_match = _CHAPTER_NUMBER_RE.search(content)
                 if num_match:
                     current_chapter = int(num_match.group(1))
             
             # Track completion sequence
-            if "MEMORY UPDATE:" in content: sequence_complete['memory_update'] = True
-            if "PLAN:" in content: sequence_complete['plan'] = True
-            if "SETTING:" in content: sequence_complete['setting'] = True
-            if "SCENE:" in content: sequence_complete['scene'] = True
-            if "FEEDBACK:" in content: sequence_complete['feedback'] = True
+            for step, marker in _SEQUENCE_MARKERS:
+                # Steps already seen don't need their marker searched again
+                if not sequence_complete[step] and marker in content:
+                    sequence_complete[step] = True
             if "SCENE FINAL:" in content:
                 sequence_complete['scene_final'] = True
-                chapter_content = content.split("SCENE FINAL:")[1].strip()
+                chapter_content = _marker_section(content, "SCENE FINAL:").strip()
             if "**Confirmation:**" in content and "successfully" in content:
                 sequence_complete['confirmation'] = True
 
-            #print all sequence_complete flags
-            print("******************** SEQUENCE COMPLETE **************", sequence_complete)
-            print("******************** CURRENT_CHAPTER ****************", current_chapter)
-            print("******************** CHAPTER_CONTENT ****************", chapter_content)
+        # Print the final state once rather than after every message
+        print("******************** SEQUENCE COMPLETE **************", sequence_complete)
+        print("******************** CURRENT_CHAPTER ****************", current_chapter)
+        print("******************** CHAPTER_CONTENT ****************", chapter_content)
         
         # Verify all steps completed and content exists
         if all(sequence_complete.values()) and current_chapter and chapter_content:
-            self._save_chapter(current_chapter, chapter_content)
             return True
             
         return False
@@ -118,9 +173,12 @@ class BookGenerator:
         if chapter_number == 1:
             return f"Initial Chapter\nRequirements:\n{prompt}"
             
+        # Keep only a moving window of recent summaries so the context stays bounded
+        recent_memory = self.chapters_memory[-self.memory_window:]
+        first_chapter = len(self.chapters_memory) - len(recent_memory) + 1
         context_parts = [
             "Previous Chapter Summaries:",
-            *[f"Chapter {i+1}: {summary}" for i, summary in enumerate(self.chapters_memory)],
+            *[f"Chapter {i}: {summary}" for i, summary in enumerate(recent_memory, first_chapter)],
             "\nCurrent Chapter Requirements:",
             prompt
         ]
@@ -140,30 +198,13 @@ class BookGenerator:
 
             # Prepare context
             context = self._prepare_chapter_context(chapter_number, prompt)
-            chapter_prompt = f"""
-            IMPORTANT: Wait for confirmation before proceeding.
-            IMPORTANT: This is Chapter {chapter_number}. Do not proceed to next chapter until explicitly instructed.
-            DO NOT END THE STORY HERE unless this is actually the final chapter ({self.outline[-1]['chapter_number']}).
-
-            Current Task: Generate Chapter {chapter_number} content only.
-
-            Chapter Outline:
-            Title: {self.outline[chapter_number - 1]['title']}
-
-            Chapter Requirements:
-            {prompt}
-
-            Previous Context for Reference:
-            {context}
-
-            Follow this exact sequence for Chapter {chapter_number} only:
-
-            1. Memory Keeper: Context (MEMORY UPDATE)
-            2. Writer: Draft (CHAPTER)
-            3. Editor: Review (FEEDBACK)
-            4. Writer Final: Revision (CHAPTER FINAL)
-
-            Wait for each step to complete before proceeding."""
+            chapter_prompt = _CHAPTER_PROMPT_TEMPLATE.format(
+                chapter_number=chapter_number,
+                final_chapter=self.outline[-1]['chapter_number'],
+                title=self._chapters_by_number[chapter_number]['title'],
+                prompt=prompt,
+                context=context
+            )
 
             # Start generation
             self.agents["user_proxy"].initiate_chat(
@@ -195,13 +236,13 @@ class BookGenerator:
             if sender in ["writer", "writer_final"]:
                 # Handle complete scene content
                 if "SCENE FINAL:" in content:
-                    scene_text = content.split("SCENE FINAL:")[1].strip()
+                    scene_text = _marker_section(content, "SCENE FINAL:").strip()
                     if scene_text:
                         return scene_text
                         
                 # Fallback to scene content
                 if "SCENE:" in content:
-                    scene_text = content.split("SCENE:")[1].strip()
+                    scene_text = _marker_section(content, "SCENE:").strip()
                     if scene_text:
                         return scene_text
                         
@@ -232,15 +273,10 @@ class BookGenerator:
                 llm_config=self.agent_config
             )
 
-            retry_prompt = f"""Emergency chapter generation for Chapter {chapter_number}.
-            
-{prompt}
-
-Please generate this chapter in two steps:
-1. Story Planner: Create a basic outline (tag: PLAN)
-2. Writer: Write the complete chapter (tag: SCENE FINAL)
-
-Keep it simple and direct."""
+            retry_prompt = _RETRY_PROMPT_TEMPLATE.format(
+                chapter_number=chapter_number,
+                prompt=prompt
+            )
 
             self.agents["user_proxy"].initiate_chat(
                 manager,
@@ -293,23 +329,26 @@ Keep it simple and direct."""
                 raise ValueError(f"No content found for Chapter {chapter_number}")
                 
             chapter_content = self._clean_chapter_content(chapter_content)
+            chapter_text = f"Chapter {chapter_number}\n\n{chapter_content}"
             
             filename = os.path.join(self.output_dir, f"chapter_{chapter_number:02d}.txt")
             
+            # Skip the backup and rewrite when the saved chapter is already identical
+            if self._read_chapter(chapter_number) == chapter_text:
+                print(f"✓ Unchanged: {filename}")
+                return
+            
             # Create backup if file exists
-            if os.path.exists(filename):
-                backup_filename = f"{filename}.backup"
-                import shutil
-                shutil.copy2(filename, backup_filename)
+            try:
+                shutil.copy2(filename, f"{filename}.backup")
+            except FileNotFoundError:
+                pass
                 
-            with open(filename, "w", encoding='utf-8') as f:
-                f.write(f"Chapter {chapter_number}\n\n{chapter_content}")
-                
-            # Verify file
-            with open(filename, "r", encoding='utf-8') as f:
-                saved_content = f.read()
-                if len(saved_content.strip()) == 0:
-                    raise IOError(f"File {filename} is empty")
+            # Write to a temp file and swap it in so a crash never leaves a partial chapter
+            tmp_filename = f"{filename}.tmp"
+            with open(tmp_filename, "w", encoding='utf-8') as f:
+                f.write(chapter_text)
+            os.replace(tmp_filename, filename)
                     
             print(f"✓ Saved to: {filename}")
             
@@ -324,43 +363,50 @@ Keep it simple and direct."""
         
         # Sort outline by chapter number
         sorted_outline = sorted(outline, key=lambda x: x["chapter_number"])
+        last_verified = None  # Chapter already checked on disk during this run
         
         for chapter in sorted_outline:
             chapter_number = chapter["chapter_number"]
             
-            # Verify previous chapter exists and is valid
-            if chapter_number > 1:
-                prev_file = os.path.join(self.output_dir, f"chapter_{chapter_number-1:02d}.txt")
-                if not os.path.exists(prev_file):
+            # Verify previous chapter exists and is valid, unless we just verified it
+            if chapter_number > 1 and last_verified != chapter_number - 1:
+                content = self._read_chapter(chapter_number - 1)
+                if content is None:
                     print(f"Previous chapter {chapter_number-1} not found. Stopping.")
                     break
                     
                 # Verify previous chapter content
-                with open(prev_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    if not self._verify_chapter_content(content, chapter_number-1):
-                        print(f"Previous chapter {chapter_number-1} content invalid. Stopping.")
-                        break
+                if not self._verify_chapter_content(content, chapter_number-1):
+                    print(f"Previous chapter {chapter_number-1} content invalid. Stopping.")
+                    break
             
             # Generate current chapter
             print(f"\n{'='*20} Chapter {chapter_number} {'='*20}")
             self.generate_chapter(chapter_number, chapter["prompt"])
             
             # Verify current chapter
-            chapter_file = os.path.join(self.output_dir, f"chapter_{chapter_number:02d}.txt")
-            if not os.path.exists(chapter_file):
+            content = self._read_chapter(chapter_number)
+            if content is None:
                 print(f"Failed to generate chapter {chapter_number}")
                 break
                 
-            with open(chapter_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                if not self._verify_chapter_content(content, chapter_number):
-                    print(f"Chapter {chapter_number} content invalid")
-                    break
+            if not self._verify_chapter_content(content, chapter_number):
+                print(f"Chapter {chapter_number} content invalid")
+                break
                     
+            last_verified = chapter_number
             print(f"✓ Chapter {chapter_number} complete")
             time.sleep(5)
 
+    def _read_chapter(self, chapter_number: int) -> Optional[str]:
+        """Read a saved chapter file, or return None if it doesn't exist"""
+        chapter_file = os.path.join(self.output_dir, f"chapter_{chapter_number:02d}.txt")
+        try:
+            with open(chapter_file, 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
     def _verify_chapter_content(self, content: str, chapter_number: int) -> bool:
         """Verify chapter content is valid"""
         if not content:
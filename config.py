@@ -1,15 +1,19 @@
 """Configuration for the book generation system"""
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional
 
-def get_config(local_url: str = "http://localhost:11434/v1") -> Dict:
+# Endpoint settings, read from the environment once at import
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL", "http://localhost:11434/v1")
+LLM_API_KEY = os.environ.get("LLM_API_KEY", "not-needed")
+
+def get_config(local_url: str = LLM_BASE_URL, cache_seed: Optional[int] = None) -> Dict:
     """Get the configuration for the agents"""
     
     # Basic config for local LLM
     config_list = [{
         'model': 'gemma3',
         'base_url': local_url,
-        'api_key': "not-needed"
+        'api_key': LLM_API_KEY
     }]
 
     # Common configuration for all agents
@@ -18,7 +22,11 @@ def get_config(local_url: str = "http://localhost:11434/v1") -> Dict:
         "temperature": 0.7,
         "config_list": config_list,
         "timeout": 600,
-        "cache_seed": None
+        "max_retries": 5,  # Rate-limited requests are retried by the OpenAI client with exponential backoff
+        "cache_seed": cache_seed  # Set an int to reuse responses from the on-disk cache (.cache/<seed>)
     }
     
     return agent_config
+
+# Default configuration, built once and shared by callers that need no overrides
+CONFIG = get_config()
@@ -1,12 +1,13 @@
 """Main script for running the book generation system"""
-from config import get_config
+import os
+from config import CONFIG
 from agents import BookAgents
 from book_generator import BookGenerator
 from outline_generator import OutlineGenerator
 
 def main():
     # Get configuration
-    agent_config = get_config()
+    agent_config = CONFIG
 
     
     # Initial prompt for the book
@@ -60,20 +61,21 @@ def main():
     # Initialize book generator with contextual agents
     book_gen = BookGenerator(agents_with_context, agent_config, outline)
     
+    # Format the outline once for both display and the saved copy
+    outline_text = "".join(
+        f"\nChapter {chapter['chapter_number']}: {chapter['title']}\n{'-' * 50}\n{chapter['prompt']}\n"
+        for chapter in outline
+    )
+
     # Print the generated outline
     print("\nGenerated Outline:")
-    for chapter in outline:
-        print(f"\nChapter {chapter['chapter_number']}: {chapter['title']}")
-        print("-" * 50)
-        print(chapter['prompt'])
+    print(outline_text, end="")
     
-    # Save the outline for reference
+    # Save the outline for reference, swapping in a complete file
     print("\nSaving outline to file...")
-    with open("book_output/outline.txt", "w") as f:
-        for chapter in outline:
-            f.write(f"\nChapter {chapter['chapter_number']}: {chapter['title']}\n")
-            f.write("-" * 50 + "\n")
-            f.write(chapter['prompt'] + "\n")
+    with open("book_output/outline.txt.tmp", "w", encoding="utf-8") as f:
+        f.write(outline_text)
+    os.replace("book_output/outline.txt.tmp", "book_output/outline.txt")
     
     # Generate the book using the outline
     print("\nGenerating book chapters...")
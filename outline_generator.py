@@ -3,6 +3,40 @@ import autogen
 from typing import Dict, List
 import re
 
+_CHAPTER_HEADER_RE = re.compile(r'Chapter \d+:')
+_CHAPTER_MARKER_RE = re.compile(r'Chapter (\d+)')
+
+# Per-chapter fields of the outline creator's format
+_TITLE_RE = re.compile(r'\*?\*?Title:\*?\*?\s*(.+?)(?=\n|$)', re.IGNORECASE)
+_HEADER_TITLE_RE = re.compile(r'\*?\*?Chapter \d+:\s*(.+?)(?=\n|$)')
+_EVENTS_RE = re.compile(r'\*?\*?Key Events:\*?\*?\s*(.*?)(?=\*?\*?Character Developments:|$)', re.DOTALL | re.IGNORECASE)
+_CHARACTER_RE = re.compile(r'\*?\*?Character Developments:\*?\*?\s*(.*?)(?=\*?\*?Setting:|$)', re.DOTALL | re.IGNORECASE)
+_SETTING_RE = re.compile(r'\*?\*?Setting:\*?\*?\s*(.*?)(?=\*?\*?Tone:|$)', re.DOTALL | re.IGNORECASE)
+_TONE_RE = re.compile(r'\*?\*?Tone:\*?\*?\s*(.*?)(?=\*?\*?Chapter \d+:|$)', re.DOTALL | re.IGNORECASE)
+_EVENT_ITEM_RE = re.compile(r'-\s*(.+?)(?=\n|$)')
+
+# Task sent to the outline group chat
+_OUTLINE_PROMPT_TEMPLATE = """Let's create a {num_chapters}-chapter outline for a book with the following premise:
+
+{initial_prompt}
+
+Process:
+1. Story Planner: Create a high-level story arc and major plot points
+2. World Builder: Suggest key settings and world elements needed
+3. Outline Creator: Generate a detailed outline with chapter titles and prompts
+
+Start with Chapter 1 and number chapters sequentially.
+
+Make sure there are at least 3 scenes in each chapter.
+
+[Continue with remaining chapters]
+
+Please output all chapters, do not leave out any chapters. Think through every chapter carefully, none should be to be determined later
+It is of utmost importance that you detail out every chapter, do not combine chapters, or leave any out
+There should be clear content for each chapter. There should be a total of {num_chapters} chapters.
+
+End the outline with 'END OF OUTLINE'"""
+
 class OutlineGenerator:
     def __init__(self, agents: Dict[str, autogen.ConversableAgent], agent_config: Dict):
         self.agents = agents
@@ -27,26 +61,10 @@ class OutlineGenerator:
         
         manager = autogen.GroupChatManager(groupchat=groupchat, llm_config=self.agent_config)
 
-        outline_prompt = f"""Let's create a {num_chapters}-chapter outline for a book with the following premise:
-
-{initial_prompt}
-
-Process:
-1. Story Planner: Create a high-level story arc and major plot points
-2. World Builder: Suggest key settings and world elements needed
-3. Outline Creator: Generate a detailed outline with chapter titles and prompts
-
-Start with Chapter 1 and number chapters sequentially.
-
-Make sure there are at least 3 scenes in each chapter.
-
-[Continue with remaining chapters]
-
-Please output all chapters, do not leave out any chapters. Think through every chapter carefully, none should be to be determined later
-It is of utmost importance that you detail out every chapter, do not combine chapters, or leave any out
-There should be clear content for each chapter. There should be a total of {num_chapters} chapters.
-
-End the outline with 'END OF OUTLINE'"""
+        outline_prompt = _OUTLINE_PROMPT_TEMPLATE.format(
+            num_chapters=num_chapters,
+            initial_prompt=initial_prompt
+        )
 
         try:
             # Initiate the chat
@@ -103,20 +121,23 @@ End the outline with 'END OF OUTLINE'"""
             return self._emergency_outline_processing(messages, num_chapters)
 
         chapters = []
-        chapter_sections = re.split(r'Chapter \d+:', outline_content)
+        # Slice each chapter's text between consecutive headers in one pass
+        headers = list(_CHAPTER_HEADER_RE.finditer(outline_content))
         
-        for i, section in enumerate(chapter_sections[1:], 1):  # Skip first empty section
+        for i, header in enumerate(headers, 1):
+            end = headers[i].start() if i < len(headers) else len(outline_content)
+            section = outline_content[header.end():end]
             try:
                     # Extract required components
-                title_match = re.search(r'\*?\*?Title:\*?\*?\s*(.+?)(?=\n|$)', section, re.IGNORECASE)
-                events_match = re.search(r'\*?\*?Key Events:\*?\*?\s*(.*?)(?=\*?\*?Character Developments:|$)', section, re.DOTALL | re.IGNORECASE)
-                character_match = re.search(r'\*?\*?Character Developments:\*?\*?\s*(.*?)(?=\*?\*?Setting:|$)', section, re.DOTALL | re.IGNORECASE)
-                setting_match = re.search(r'\*?\*?Setting:\*?\*?\s*(.*?)(?=\*?\*?Tone:|$)', section, re.DOTALL | re.IGNORECASE)
-                tone_match = re.search(r'\*?\*?Tone:\*?\*?\s*(.*?)(?=\*?\*?Chapter \d+:|$)', section, re.DOTALL | re.IGNORECASE)
+                title_match = _TITLE_RE.search(section)
+                events_match = _EVENTS_RE.search(section)
+                character_match = _CHARACTER_RE.search(section)
+                setting_match = _SETTING_RE.search(section)
+                tone_match = _TONE_RE.search(section)
 
                 # If no explicit title match, try to get it from the chapter header
                 if not title_match:
-                    title_match = re.search(r'\*?\*?Chapter \d+:\s*(.+?)(?=\n|$)', section)
+                    title_match = _HEADER_TITLE_RE.search(section)
 
                 # Verify all components exist
                 if not all([title_match, events_match, character_match, setting_match, tone_match]):
@@ -143,7 +164,7 @@ End the outline with 'END OF OUTLINE'"""
                 }
                 
                 # Verify events (at least 3)
-                events = re.findall(r'-\s*(.+?)(?=\n|$)', events_match.group(1))
+                events = _EVENT_ITEM_RE.findall(events_match.group(1))
                 if len(events) < 3:
                     print(f"Chapter {i} has fewer than 3 events")
                     continue
@@ -194,11 +215,12 @@ End the outline with 'END OF OUTLINE'"""
         for msg in messages:
             content = msg.get("content", "")
             lines = content.split('\n')
+            has_key_events = "Key events:" in content  # Same for every line of this message
             
             for line in lines:
                 # Look for chapter markers
-                chapter_match = re.search(r'Chapter (\d+)', line)
-                if chapter_match and "Key events:" in content:
+                chapter_match = has_key_events and _CHAPTER_MARKER_RE.search(line)
+                if chapter_match:
                     if current_chapter:
                         chapters.append(current_chapter)
                     